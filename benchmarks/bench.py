@@ -0,0 +1,220 @@
+# benchmark the conversion stage by stage on synthetic documents (see
+# make_docx.py), with and without --verbose, and write the results as JSON
+# so that two versions can be compared.
+#
+# every conversion runs in a fresh process, so that peak RSS means
+# something. the stages are the module functions listed in STAGES: each
+# is wrapped to record the wall and CPU time spent in it (not counting
+# time in other wrapped stages it calls), the RSS high-water mark of the
+# process once it returns, and the size of its output where it is bytes.
+# whatever falls between the stages is reported as "other".
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from make_docx import makeDocx
+
+# the synthetic documents that can be benchmarked; the keys are makeDocx's arguments
+DOCUMENTS = {
+  "small": {"paragraphs": 200, "styles": 10, "formatted": 0.3, "runs": 3, "images": 1, "imageSize": 20 * 1024},
+  "medium": {"paragraphs": 2000, "styles": 40, "formatted": 0.3, "runs": 4, "images": 10, "imageSize": 100 * 1024},
+  "large": {"paragraphs": 20000, "styles": 80, "formatted": 0.3, "runs": 4, "images": 20, "imageSize": 200 * 1024},
+  "formatted": {"paragraphs": 2000, "styles": 40, "formatted": 0.9, "runs": 8, "images": 0},
+  "images": {"paragraphs": 500, "styles": 10, "formatted": 0.1, "runs": 2, "images": 60, "imageSize": 500 * 1024},
+}
+
+# the convert options for each mode
+MODES = {
+  "map": {"map_styles": True, "verbose": False},
+  "verbose": {"map_styles": True, "verbose": True},
+}
+
+# the functions timed as stages, in pipeline order
+STAGES = ["getStyleIndex", "getStyleAttrs", "getStyleMapLines", "getStyleRegistry", "getDirectFormatting",
+          "streamDirectFormatting", "rewriteParts", "rewritePart", "rebuildDocx", "buildDocx", "getStyleMap",
+          "convert_to_html", "processHTML", "writeHTML"]
+
+def getPeakRSS():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes on Linux, bytes on macOS
+  return peak if sys.platform == "darwin" else peak * 1024
+
+def getOutputSize(value):
+  if isinstance(value, (bytes, bytearray, str)):
+    return len(value)
+  if isinstance(value, io.BytesIO):
+    return value.getbuffer().nbytes
+  if hasattr(value, "value") and isinstance(value.value, (bytes, str)):
+    # a mammoth result
+    return len(value.value)
+  return None
+
+# wrap a function so its calls are recorded in stages[name]
+def timeStage(stages, stack, name, function):
+  def timed(*args, **kwargs):
+    # the wall and CPU time spent in the stages nested in this one
+    stack.append([0.0, 0.0])
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+      value = function(*args, **kwargs)
+    finally:
+      wall = time.perf_counter() - wall
+      cpu = time.process_time() - cpu
+      nested = stack.pop()
+      if stack:
+        stack[-1][0] += wall
+        stack[-1][1] += cpu
+      stage = stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "output_bytes": None})
+      stage["calls"] += 1
+      # the time spent in nested stages is theirs, not ours
+      stage["wall"] += wall - nested[0]
+      stage["cpu"] += cpu - nested[1]
+      stage["peak_rss"] = getPeakRSS()
+    size = getOutputSize(value)
+    if size is not None:
+      stage["output_bytes"] = (stage["output_bytes"] or 0) + size
+    return value
+  return timed
+
+# convert one document in this process and return the measurements
+def runOne(path, mode, options):
+  import mammoth
+  import mammoth_verbose
+
+  stages = {}
+  stack = []
+  for name in STAGES:
+    if name == "convert_to_html":
+      mammoth.convert_to_html = timeStage(stages, stack, name, mammoth.convert_to_html)
+    elif hasattr(mammoth_verbose, name):
+      setattr(mammoth_verbose, name, timeStage(stages, stack, name, getattr(mammoth_verbose, name)))
+
+  startRSS = getPeakRSS()
+  wall = time.perf_counter()
+  cpu = time.process_time()
+  result = mammoth_verbose.convert(path, **dict(MODES[mode], **options))
+  wall = time.perf_counter() - wall
+  cpu = time.process_time() - cpu
+
+  stages["other"] = {"calls": 1, "wall": wall - sum(stage["wall"] for stage in stages.values()),
+                     "cpu": cpu - sum(stage["cpu"] for stage in stages.values()), "output_bytes": None,
+                     "peak_rss": getPeakRSS()}
+  return {"wall": wall, "cpu": cpu, "start_rss": startRSS, "peak_rss": getPeakRSS(), "input_bytes": os.path.getsize(path),
+          "output_bytes": getOutputSize(result), "messages": len(result.messages),
+          "stages": dict((name, stages[name]) for name in STAGES + ["other"] if name in stages)}
+
+# convert one document in a fresh process, repeat times, keeping the
+# fastest run
+def runDocument(path, mode, options, repeat):
+  best = None
+  for i in range(repeat):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", path, mode, json.dumps(options)],
+                            check=True, stdout=subprocess.PIPE).stdout
+    run = json.loads(output)
+    if best is None or run["wall"] < best["wall"]:
+      best = run
+  return best
+
+def getVersion():
+  try:
+    return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+# the stages, and whole runs, that got slower than the baseline by more
+# than threshold (a fraction); stages under minimum seconds in the
+# baseline are too noisy to judge
+def getRegressions(baseline, results, threshold, minimum=0.005):
+  old = dict(((run["document"], run["mode"]), run) for run in baseline["runs"])
+  regressions = []
+  for run in results["runs"]:
+    before = old.get((run["document"], run["mode"]))
+    if before is None:
+      continue
+    pairs = [("total", before["wall"], run["wall"])]
+    for name, stage in run["stages"].items():
+      if name in before["stages"]:
+        pairs.append((name, before["stages"][name]["wall"], stage["wall"]))
+    for name, was, now in pairs:
+      if was >= minimum and now > was * (1 + threshold):
+        regressions.append("%s/%s %s: %.3fs -> %.3fs (+%d%%)" % (run["document"], run["mode"], name, was, now, round((now / was - 1) * 100)))
+  return regressions
+
+def printResults(results):
+  for run in results["runs"]:
+    print("%s/%s: %.3fs wall, %.3fs cpu, peak RSS %.1fMB, %d bytes of HTML"
+          % (run["document"], run["mode"], run["wall"], run["cpu"], run["peak_rss"] / 1048576.0, run["output_bytes"]))
+    for name, stage in run["stages"].items():
+      print("  %-24s %8.3fs %8.3fs cpu %8.1fMB%s" % (name, stage["wall"], stage["cpu"], stage["peak_rss"] / 1048576.0,
+            "" if stage["output_bytes"] is None else " %12d bytes" % stage["output_bytes"]))
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark mammoth-verbose on synthetic documents.')
+  parser.add_argument('--documents', nargs="+", default=["small", "medium"], choices=sorted(DOCUMENTS),
+                      help='The documents to benchmark. Default is small and medium.')
+  parser.add_argument('--modes', nargs="+", default=sorted(MODES), choices=sorted(MODES),
+                      help='The modes to benchmark each document in. Default is all of them.')
+  parser.add_argument('--stream', action='store_true', default=False, help='Convert with stream=True.')
+  parser.add_argument('--on-disk', dest='onDisk', action='store_true', default=False, help='Convert with on_disk=True.')
+  parser.add_argument('--repeat', type=int, default=3, help='Runs per document and mode; the fastest is kept. Default is %(default)s.')
+  parser.add_argument('-o', dest='output', metavar="FILE", help='Write the results to this JSON file.')
+  parser.add_argument('--compare', metavar="FILE", help='Compare against the results in this JSON file, and exit with 1 on a regression.')
+  parser.add_argument('--threshold', type=float, default=0.1, help='The slowdown, as a fraction, that counts as a regression. Default is %(default)s.')
+  parser.add_argument('--run', nargs=3, help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+
+  if args.run:
+    path, mode, options = args.run
+    json.dump(runOne(path, mode, json.loads(options)), sys.stdout)
+    return 0
+
+  options = {"stream": args.stream, "on_disk": args.onDisk}
+  results = {"version": getVersion(), "python": platform.python_version(), "platform": platform.platform(),
+             "options": options, "runs": []}
+  workDir = tempfile.mkdtemp(prefix="mammoth-verbose-bench-")
+  try:
+    for document in args.documents:
+      path = makeDocx(os.path.join(workDir, document + ".docx"), **DOCUMENTS[document])
+      for mode in args.modes:
+        run = runDocument(path, mode, options, args.repeat)
+        run.update({"document": document, "mode": mode, "parameters": DOCUMENTS[document]})
+        results["runs"].append(run)
+  finally:
+    for name in os.listdir(workDir):
+      os.remove(os.path.join(workDir, name))
+    os.rmdir(workDir)
+
+  printResults(results)
+  if args.output:
+    with open(args.output, "w") as output:
+      json.dump(results, output, indent=2)
+
+  if args.compare:
+    with open(args.compare) as baseline:
+      baseline = json.load(baseline)
+    # stream and on-disk conversions take different paths, so their times don't compare
+    if baseline.get("options") != results["options"]:
+      print("can't compare: the baseline was run with %s, and this with %s"
+            % (json.dumps(baseline.get("options")), json.dumps(results["options"])), file=sys.stderr)
+      return 2
+    regressions = getRegressions(baseline, results, args.threshold)
+    for regression in regressions:
+      print("regression: " + regression, file=sys.stderr)
+    if regressions:
+      return 1
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
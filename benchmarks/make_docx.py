@@ -0,0 +1,186 @@
+# generate synthetic .docx files for benchmarking, with control over the
+# things that drive conversion cost: the number of paragraphs and styles,
+# how much of the text carries direct formatting, how many runs each
+# paragraph has, how much image data is embedded and how many footnotes
+# there are.
+# the output is deterministic for a given set of parameters and seed.
+import argparse
+import random
+import struct
+import zipfile
+import zlib
+
+NAMESPACES = ('xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+              'xmlns:w14="http://schemas.microsoft.com/office/word/2010/wordml" '
+              'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+              'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+              'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+              'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"')
+
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                 '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                 '<Default Extension="xml" ContentType="application/xml"/>'
+                 '<Default Extension="png" ContentType="image/png"/>'
+                 '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                 '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+                 '%s</Types>')
+
+FOOTNOTES_CONTENT_TYPE = '<Override PartName="/word/footnotes.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"/>'
+
+PACKAGE_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+                '</Relationships>')
+
+# the formatting that direct formatting is drawn from
+PARAGRAPH_FORMATTING = ['<w:jc w:val="center"/>', '<w:jc w:val="right"/>', '<w:jc w:val="both"/>',
+                        '<w:ind w:left="720"/>', '<w:ind w:firstLine="360"/>', '<w:spacing w:before="240"/>',
+                        '<w:keepNext/>', '<w:spacing w:after="0"/>']
+RUN_FORMATTING = ['<w:b/>', '<w:i/>', '<w:u w:val="single"/>', '<w:smallCaps/>', '<w:strike/>',
+                  '<w:sz w:val="28"/>', '<w:color w:val="C00000"/>', '<w:vertAlign w:val="superscript"/>']
+
+WORDS = ("the quick brown fox jumps over a lazy dog while seven wizards quietly "
+         "box jumping frogs near an old stone bridge at dawn").split()
+
+def getStylesXML(paragraphStyles, characterStyles):
+  styles = ['<w:docDefaults><w:rPrDefault><w:rPr><w:sz w:val="22"/></w:rPr></w:rPrDefault>'
+            '<w:pPrDefault><w:pPr><w:spacing w:after="160"/></w:pPr></w:pPrDefault></w:docDefaults>',
+            '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>']
+  for i in range(paragraphStyles):
+    # each style is based on the previous one, so there are chains to follow
+    basedOn = "Normal" if i == 0 else "Para%d" % (i - 1)
+    styles.append('<w:style w:type="paragraph" w:styleId="Para%d"><w:name w:val="Para %d"/><w:basedOn w:val="%s"/>'
+                  '<w:pPr>%s</w:pPr><w:rPr>%s</w:rPr></w:style>'
+                  % (i, i, basedOn, PARAGRAPH_FORMATTING[i % len(PARAGRAPH_FORMATTING)], RUN_FORMATTING[i % len(RUN_FORMATTING)]))
+  for i in range(characterStyles):
+    styles.append('<w:style w:type="character" w:styleId="Char%d"><w:name w:val="Char %d"/><w:rPr>%s</w:rPr></w:style>'
+                  % (i, i, RUN_FORMATTING[i % len(RUN_FORMATTING)]))
+  return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:styles %s>%s</w:styles>'
+          % (NAMESPACES, "".join(styles)))
+
+def getDocumentRels(images, notes):
+  relationships = ['<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>']
+  if notes:
+    relationships.append('<Relationship Id="rIdNotes" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/footnotes" Target="footnotes.xml"/>')
+  for i in range(images):
+    relationships.append('<Relationship Id="rIdImage%d" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/image%d.png"/>' % (i, i))
+  return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+          '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">%s</Relationships>'
+          % "".join(relationships))
+
+def getImageRun(i):
+  return ('<w:r><w:drawing><wp:inline><wp:extent cx="952500" cy="952500"/><wp:docPr id="%d" name="Picture %d" descr="Figure %d"/>'
+          '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+          '<pic:blipFill><a:blip r:embed="rIdImage%d"/></pic:blipFill></pic:pic></a:graphicData></a:graphic>'
+          '</wp:inline></w:drawing></w:r>' % (i + 1, i + 1, i + 1, i))
+
+# a valid PNG of about the given size; the pixels are noise, so it
+# doesn't compress away
+def getImageData(size, rng):
+  width = 256
+  height = max(1, size // (width * 3 + 1))
+  raw = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+  def chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+  return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+          + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+def getNoteReference(i):
+  return '<w:r><w:rPr><w:vertAlign w:val="superscript"/></w:rPr><w:footnoteReference w:id="%d"/></w:r>' % (i + 1)
+
+# the footnotes, with the same mix of styles and direct formatting as the text
+def getFootnotesXML(notes, paragraphStyles, formatted, rng):
+  footnotes = ['<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>',
+               '<w:footnote w:type="continuationSeparator" w:id="0"><w:p><w:r><w:continuationSeparator/></w:r></w:p></w:footnote>']
+  for i in range(notes):
+    pPr = []
+    if paragraphStyles and i % 2:
+      pPr.append('<w:pStyle w:val="Para%d"/>' % rng.randrange(paragraphStyles))
+    if rng.random() < formatted:
+      pPr.extend(rng.sample(PARAGRAPH_FORMATTING, rng.randint(1, 2)))
+    rPr = rng.sample(RUN_FORMATTING, rng.randint(1, 2)) if rng.random() < formatted else []
+    text = " ".join(rng.choice(WORDS) for _ in range(12))
+    footnotes.append('<w:footnote w:id="%d"><w:p w14:paraId="%08X">%s<w:r><w:rPr><w:vertAlign w:val="superscript"/></w:rPr><w:footnoteRef/></w:r>'
+                     '<w:r>%s<w:t xml:space="preserve"> %s</w:t></w:r></w:p></w:footnote>'
+                     % (i + 1, 0x20000000 + i, '<w:pPr>%s</w:pPr>' % "".join(pPr) if pPr else "",
+                        '<w:rPr>%s</w:rPr>' % "".join(rPr) if rPr else "", text))
+  return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:footnotes %s>%s</w:footnotes>'
+          % (NAMESPACES, "".join(footnotes)))
+
+def getDocumentXML(paragraphs, paragraphStyles, characterStyles, formatted, runs, images, notes, rng):
+  # spread the images, and the footnote references, evenly through the text
+  imageAt = {}
+  for i in range(images):
+    imageAt[(i * paragraphs) // images] = imageAt.get((i * paragraphs) // images, []) + [i]
+  noteAt = {}
+  for i in range(notes):
+    noteAt[(i * paragraphs) // notes] = noteAt.get((i * paragraphs) // notes, []) + [i]
+
+  body = []
+  for p in range(paragraphs):
+    pPr = []
+    if paragraphStyles and p % 4:
+      pPr.append('<w:pStyle w:val="Para%d"/>' % rng.randrange(paragraphStyles))
+    if rng.random() < formatted:
+      pPr.extend(rng.sample(PARAGRAPH_FORMATTING, rng.randint(1, 2)))
+    xml = ['<w:p w14:paraId="%08X">' % (0x10000000 + p)]
+    if pPr:
+      xml.append('<w:pPr>%s</w:pPr>' % "".join(pPr))
+    for r in range(runs):
+      rPr = []
+      if characterStyles and rng.random() < 0.25:
+        rPr.append('<w:rStyle w:val="Char%d"/>' % rng.randrange(characterStyles))
+      if rng.random() < formatted:
+        rPr.extend(rng.sample(RUN_FORMATTING, rng.randint(1, 2)))
+      text = " ".join(rng.choice(WORDS) for _ in range(8))
+      xml.append('<w:r>%s<w:t xml:space="preserve">%s </w:t></w:r>' % ('<w:rPr>%s</w:rPr>' % "".join(rPr) if rPr else "", text))
+    for i in imageAt.get(p, []):
+      xml.append(getImageRun(i))
+    for i in noteAt.get(p, []):
+      xml.append(getNoteReference(i))
+    xml.append('</w:p>')
+    body.append("".join(xml))
+  return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document %s><w:body>%s<w:sectPr/></w:body></w:document>'
+          % (NAMESPACES, "".join(body)))
+
+# write a synthetic docx to path.
+# formatted is the fraction of paragraphs, and separately of runs, that
+# carry direct formatting; styles is the number of paragraph styles, and
+# half as many character styles are added; imageSize is in bytes.
+def makeDocx(path, paragraphs=1000, styles=20, formatted=0.3, runs=3, images=0, imageSize=100 * 1024, notes=0, seed=1):
+  rng = random.Random(seed)
+  docx = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+  try:
+    docx.writestr("[Content_Types].xml", CONTENT_TYPES % (FOOTNOTES_CONTENT_TYPE if notes else ""))
+    docx.writestr("_rels/.rels", PACKAGE_RELS)
+    docx.writestr("word/_rels/document.xml.rels", getDocumentRels(images, notes))
+    docx.writestr("word/styles.xml", getStylesXML(styles, styles // 2))
+    docx.writestr("word/document.xml", getDocumentXML(paragraphs, styles, styles // 2, formatted, runs, images, notes, rng))
+    for i in range(images):
+      # images are stored, the way Word stores them
+      docx.writestr("word/media/image%d.png" % i, getImageData(imageSize, rng), compress_type=zipfile.ZIP_STORED)
+    if notes:
+      docx.writestr("word/footnotes.xml", getFootnotesXML(notes, styles, formatted, rng))
+  finally:
+    docx.close()
+  return path
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Generate a synthetic docx for benchmarking mammoth-verbose.')
+  parser.add_argument("-o", dest="output", required=True, metavar="FILE", help="The docx file to write.")
+  parser.add_argument('--paragraphs', type=int, default=1000, help='Number of paragraphs. Default is %(default)s.')
+  parser.add_argument('--styles', type=int, default=20, help='Number of paragraph styles; half as many character styles are added. Default is %(default)s.')
+  parser.add_argument('--formatted', type=float, default=0.3, help='Fraction of paragraphs and of runs with direct formatting. Default is %(default)s.')
+  parser.add_argument('--runs', type=int, default=3, help='Runs per paragraph. Default is %(default)s.')
+  parser.add_argument('--images', type=int, default=0, help='Number of embedded images. Default is %(default)s.')
+  parser.add_argument('--image-size', dest='imageSize', type=int, default=100, metavar="KB", help='Size of each image in kilobytes. Default is %(default)s.')
+  parser.add_argument('--notes', type=int, default=0, help='Number of footnotes. Default is %(default)s.')
+  parser.add_argument('--seed', type=int, default=1, help='Random seed. Default is %(default)s.')
+  args = parser.parse_args(argv)
+
+  makeDocx(args.output, paragraphs=args.paragraphs, styles=args.styles, formatted=args.formatted, runs=args.runs,
+           images=args.images, imageSize=args.imageSize * 1024, notes=args.notes, seed=args.seed)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,1544 @@
+from lxml import etree
+from lxml.builder import E
+from lxml.builder import ElementMaker
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import shutil
+import argparse
+import os.path
+import io
+import struct
+import sys
+import tempfile
+import threading
+import uuid
+import time
+import contextlib
+import functools
+import hashlib
+import json
+import mimetypes
+import posixpath
+import mammoth
+import multiprocessing.util
+import zipfile
+import re
+from copy import deepcopy
+try:
+  import resource
+except ImportError:
+  # not available on Windows, where profiles leave out memory use
+  resource = None
+
+# set our modified class name suffix
+suffix = 'HEDmod'
+
+# the default size limit of the persistent style cache, in bytes
+cacheSize = 64 * 1024 * 1024
+
+# function to read the styles.xml file from within the docx;
+# this is used for extracting style names and formatting information.
+
+def unZip(myfile, path):
+  document = zipfile.ZipFile(myfile)
+  document.extractall(path)
+  document.close()
+  return
+
+# zip up the extracted tree at path; members are named relative to path,
+# so there is no need to change the working directory
+def zipDocx(path, myfile):
+  zf = zipfile.ZipFile(myfile, "w")
+  for dirname, subdirs, files in os.walk(path):
+    if dirname != path:
+      zf.write(dirname, os.path.relpath(dirname, path))
+    for filename in files:
+      filename = os.path.join(dirname, filename)
+      zf.write(filename, os.path.relpath(filename, path))
+  zf.close()
+  return
+
+# copy a member from one zip into another as-is,
+# without decompressing and recompressing its data
+def copyZipMember(source, target, info):
+  # skip past the local file header to the compressed data
+  source.fp.seek(info.header_offset)
+  header = source.fp.read(30)
+  nameLength, extraLength = struct.unpack("<HH", header[26:30])
+  source.fp.seek(nameLength + extraLength, os.SEEK_CUR)
+
+  newinfo = zipfile.ZipInfo(info.filename, info.date_time)
+  newinfo.compress_type = info.compress_type
+  newinfo.external_attr = info.external_attr
+  # the sizes are known up front, so no trailing data descriptor is needed
+  newinfo.flag_bits = info.flag_bits & ~0x08
+  newinfo.CRC = info.CRC
+  newinfo.compress_size = info.compress_size
+  newinfo.file_size = info.file_size
+  newinfo.header_offset = target.fp.tell()
+  target.fp.write(newinfo.FileHeader())
+
+  remaining = info.compress_size
+  while remaining > 0:
+    chunk = source.fp.read(min(remaining, 1024 * 1024))
+    target.fp.write(chunk)
+    remaining -= len(chunk)
+
+  target.filelist.append(newinfo)
+  target.NameToInfo[newinfo.filename] = newinfo
+  target.start_dir = target.fp.tell()
+  return
+
+# write a rewritten part: either its bytes, or a function that
+# streams the part into the open file it is given
+def writePart(outfile, data):
+  if callable(data):
+    data(outfile)
+  else:
+    outfile.write(data)
+
+# build the new docx in memory (or in newdocx, if given): the rewritten
+# parts are written first, in the order given, and every other member is
+# reused straight from the original package
+def buildDocx(myfile, parts, newdocx=None):
+  source = zipfile.ZipFile(myfile)
+  if newdocx is None:
+    newdocx = io.BytesIO()
+  target = zipfile.ZipFile(newdocx, "w")
+  for name, data in parts.items():
+    info = source.getinfo(name)
+    newinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    newinfo.compress_type = zipfile.ZIP_DEFLATED
+    newinfo.external_attr = info.external_attr
+    if callable(data):
+      with target.open(newinfo, "w") as outfile:
+        writePart(outfile, data)
+    else:
+      target.writestr(newinfo, data)
+  for info in source.infolist():
+    if info.filename not in parts:
+      copyZipMember(source, target, info)
+  target.close()
+  source.close()
+  newdocx.seek(0)
+  return newdocx
+
+def getWordStyles(myzip):
+  zip = zipfile.ZipFile(myzip)
+  xml_content = zip.read('word/styles.xml')
+  return xml_content
+
+def getWordText(myzip):
+  zip = zipfile.ZipFile(myzip)
+  xml_content = zip.read('word/document.xml')
+  return xml_content
+
+# get all the formatting attributes for a style
+def getAttrs(element, inputKey="data", inputVal="", inputDict=None):
+  attrKey = element.tag
+  attrKey = inputKey + "-" + attrKey.split("}").pop()
+  attributes = element.attrib
+  children = list(element)
+  attrVal = ""
+  if len(attributes) == 0 and len(children) == 0:
+    attrVal = "true"
+  elif len(attributes) == 1 and element.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val"):
+    attrVal = element.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val")
+  elif len(attributes) > 0:
+    for name, value in sorted(element.items()):
+      name = name.split("}").pop()
+      attrVal = attrVal + "%s:%r;" % (name, value)
+  # loop through sub-children and add as attr
+  walkChildren(element, attrKey, "", inputDict)
+
+  return attrKey, attrVal
+
+# walk through the element tree for a style
+def walkChildren(element, inputKey="data", inputVal="", inputDict=None):
+  if inputDict is None:
+    inputDict = {}
+  children = list(element)
+  attrKey = ""
+  attrVal = ""
+  for child in element:
+    attrKey, attrVal = getAttrs(child, inputKey, "", inputDict)
+    inputDict[attrKey] = attrVal
+  return attrKey, attrVal, inputDict
+
+# index the style elements in styles.xml by styleId, so a style can be
+# looked up without scanning the whole styles tree
+def getStyleIndex(styles_root):
+  styleIndex = {}
+  for style in styles_root.iter("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}style"):
+    # like find(), the first style with a given id wins
+    styleIndex.setdefault(style.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}styleId"), style)
+  return styleIndex
+
+# bringing together getWordStyles, getAttrs, and walkChildren
+# to create the final verboseDict of all style names and their
+# formatting information.
+def getAllStyles(myfile):
+  # parse the incoming XML
+  source = getWordStyles(myfile)
+  root = etree.fromstring(source)
+  return getStyleAttrs(getStyleIndex(root))
+
+# the verbose attributes for each style in a styleId -> element dict
+def getStyleAttrs(styleIndex):
+  paragraphStyles = {}
+  characterStyles = {}
+  # a single pass over the indexed styles, sorting them by type
+  for styleID, style in styleIndex.items():
+    styleType = style.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type")
+    if styleType == 'paragraph':
+      styleID = styleID.replace("(","").replace(")","")
+      wType = 'p'
+      typeStyles = paragraphStyles
+    elif styleType == 'character':
+      wType = 'r'
+      typeStyles = characterStyles
+    else:
+      continue
+    # reset the dictionary for this style's children
+    allAttr = {}
+    # walk the child tree to collect all elements and their attributes into the dictionary
+    attrKey, attrVal, allAttr = walkChildren(style, "data", "", allAttr)
+    allAttr['data-w-type'] = wType
+    # add the style ID to the master dictionary with value = the collected child elements
+    typeStyles[styleID] = allAttr
+
+  # paragraph styles first, then character styles
+  allStyles = paragraphStyles
+  allStyles.update(characterStyles)
+  return allStyles
+
+# the properties that are merged attribute by attribute down a basedOn
+# chain; any other property a style sets replaces the inherited one whole
+mergedProperties = set(["{http://schemas.openxmlformats.org/wordprocessingml/2006/main}ind",
+                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}spacing",
+                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rFonts",
+                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}lang"])
+
+# the properties in own (a pPr or rPr) applied on top of the inherited ones
+def mergeProperties(inherited, own):
+  if inherited is None:
+    return deepcopy(own)
+  merged = deepcopy(inherited)
+  if own is None:
+    return merged
+  for prop in own:
+    current = merged.find(prop.tag)
+    if current is not None and prop.tag in mergedProperties:
+      for name, value in prop.items():
+        current.set(name, value)
+    elif current is not None:
+      merged.replace(current, deepcopy(prop))
+    else:
+      merged.append(deepcopy(prop))
+  return merged
+
+# the effective formatting of every paragraph and character style: a copy of
+# each style whose pPr and rPr hold everything it inherits, from the
+# docDefaults down its basedOn chain. each style is resolved once, so the
+# styles sharing an ancestor share the work of resolving it.
+# the styles in defaultBased have no basedOn but stand in for direct
+# formatting, so they inherit from the default style of their type.
+def getResolvedStyleIndex(styles_root, styleIndex, defaultBased=()):
+  defaults = {"pPr": styles_root.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}docDefaults/{http://schemas.openxmlformats.org/wordprocessingml/2006/main}pPrDefault/{http://schemas.openxmlformats.org/wordprocessingml/2006/main}pPr"),
+              "rPr": styles_root.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}docDefaults/{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPrDefault/{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPr")}
+  defaultStyles = {}
+  for styleID, style in styleIndex.items():
+    if style.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}default") in ("1", "true", "on"):
+      defaultStyles.setdefault(style.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type"), styleID)
+
+  resolved = {}
+  def resolve(styleID, chain):
+    if styleID in resolved:
+      return resolved[styleID]
+    style = styleIndex[styleID]
+    styleType = style.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type")
+    basedOn = style.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}basedOn")
+    parentID = basedOn.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val") if basedOn is not None else None
+    if parentID is None and styleID in defaultBased:
+      parentID = defaultStyles.get(styleType)
+    parent = None
+    # a chain that loops back on itself is cut where it does
+    if parentID in styleIndex and parentID not in chain and styleIndex[parentID].get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type") == styleType:
+      parent = resolve(parentID, chain + (styleID,))
+
+    resolvedStyle = deepcopy(style)
+    for name in ("pPr", "rPr"):
+      if name == "pPr" and styleType != "paragraph":
+        continue
+      if parent is not None:
+        inherited = parent.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}" + name)
+      else:
+        inherited = defaults[name]
+      own = resolvedStyle.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}" + name)
+      if inherited is None and own is None:
+        continue
+      merged = mergeProperties(inherited, own)
+      merged.tag = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}" + name
+      if own is not None:
+        resolvedStyle.replace(own, merged)
+      else:
+        resolvedStyle.append(merged)
+    resolved[styleID] = resolvedStyle
+    return resolvedStyle
+
+  for styleID, style in styleIndex.items():
+    if style.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type") in ("paragraph", "character"):
+      resolve(styleID, ())
+  return resolved
+
+# the verbose attributes of the effective formatting of each style in a
+# docx (given as a path or as the raw bytes), by class name
+def getResolvedStyles(path_or_bytes):
+  if isinstance(path_or_bytes, (bytes, bytearray)):
+    path_or_bytes = io.BytesIO(path_or_bytes)
+  styles_root = etree.fromstring(getWordStyles(path_or_bytes))
+  return getStyleAttrs(getResolvedStyleIndex(styles_root, getStyleIndex(styles_root)))
+
+# combine several sets of verbose attributes, keeping
+# all the paragraph styles ahead of the character styles
+def mergeStyles(*styleDicts):
+  allStyles = {}
+  for wType in ('p', 'r'):
+    for styles in styleDicts:
+      for styleID, attrs in styles.items():
+        if attrs['data-w-type'] == wType:
+          allStyles[styleID] = attrs
+  return allStyles
+
+# write data to path under a unique temporary name and then move it into
+# place, so concurrent writers never leave a mix of both behind and
+# readers never see a half-written file
+# (data is bytes, or a function that writes into the open file; see writePart)
+def writeAtomic(path, data):
+  tempPath = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+  outfile = open(tempPath, 'xb')
+  try:
+    writePart(outfile, data)
+    outfile.close()
+    os.replace(tempPath, path)
+  except BaseException:
+    outfile.close()
+    os.remove(tempPath)
+    raise
+
+# the persistent style cache. each distinct styles.xml gets one JSON file,
+# named by the SHA-256 of its content, holding the verbose attributes and
+# style map lines of its styles. file mtimes double as last-used times, so
+# the least recently used entries are dropped once the cache outgrows its
+# size limit.
+def getCachePath(cacheDir, stylesSource):
+  return os.path.join(cacheDir, hashlib.sha256(stylesSource).hexdigest() + ".json")
+
+def readStyleCache(cacheDir, stylesSource):
+  cachePath = getCachePath(cacheDir, stylesSource)
+  try:
+    cachefile = open(cachePath)
+    try:
+      entry = json.load(cachefile)
+    finally:
+      cachefile.close()
+    os.utime(cachePath)
+  except (OSError, ValueError):
+    return None
+  return entry
+
+def writeStyleCache(cacheDir, stylesSource, entry, maxSize=cacheSize):
+  os.makedirs(cacheDir, exist_ok=True)
+  writeAtomic(getCachePath(cacheDir, stylesSource), json.dumps(entry).encode("utf-8"))
+  pruneCache(cacheDir, maxSize)
+
+# drop the least recently used cache files until the cache fits in maxSize
+def pruneCache(cacheDir, maxSize):
+  entries = []
+  for name in os.listdir(cacheDir):
+    if name.endswith(".json"):
+      try:
+        stat = os.stat(os.path.join(cacheDir, name))
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+  total = sum(entry[1] for entry in entries)
+  for mtime, size, name in sorted(entries):
+    if total <= maxSize:
+      break
+    try:
+      os.remove(os.path.join(cacheDir, name))
+    except OSError:
+      pass
+    total -= size
+
+# a canonical signature for a piece of direct formatting: a hash of the
+# element type, the style it modifies and the formatting elements
+# themselves, serialized as canonical XML so attribute order and prefixes
+# don't matter
+def getFormatSignature(wType, stylename, formatting):
+  signature = hashlib.sha1()
+  signature.update(("%s\0%s\0" % (wType, stylename or "")).encode("utf-8"))
+  for format in formatting:
+    signature.update(etree.tostring(format, method="c14n", exclusive=True))
+  return signature.hexdigest()
+
+# synthesized style names are numbered from the formatting signature rather
+# than in order of appearance, so the same formatting gets the same name in
+# every conversion of a document, however much of it is converted
+def getSyntheticName(stylename, signature, registry):
+  number = int(signature[:10], 16)
+  while (stylename or "") + suffix + str(number) in registry["index"]:
+    number += 1
+  return (stylename or "") + suffix + str(number)
+
+# moving formatting into a synthesized style can leave some of it behind
+# on the element (anything merged into an existing property of the style);
+# collect what was left, so later elements with the same signature can be
+# left in exactly the same state
+def getLeftovers(formatting, parents):
+  leftovers = []
+  for format, parent in zip(formatting, parents):
+    if format.getparent() is parent:
+      leftovers.append(deepcopy(format))
+  return leftovers
+
+# strip the direct formatting from an element that reuses an existing
+# synthesized style, leaving only the recorded leftovers
+def replaceFormatting(formatting, leftovers):
+  parent = formatting[0].getparent()
+  for format in formatting:
+    format.getparent().remove(format)
+  for leftover in leftovers:
+    parent.append(deepcopy(leftover))
+
+# namespace declarations for the element methods used in the rewrite
+WORD_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+w = "{%s}" % WORD_NAMESPACE
+
+WORD14_NAMESPACE = "http://schemas.microsoft.com/office/word/2010/wordml"
+w14 = "{%s}" % WORD14_NAMESPACE
+
+NSMAP = {None : WORD_NAMESPACE}
+NAMESPACES = {'w': WORD_NAMESPACE}
+
+# the tags and attributes the rewrite looks up over and over
+W_P = w + "p"
+W_PPR = w + "pPr"
+W_PSTYLE = w + "pStyle"
+W_R = w + "r"
+W_RPR = w + "rPr"
+W_RSTYLE = w + "rStyle"
+W_NAME = w + "name"
+W_BASEDON = w + "basedOn"
+W_VAL = w + "val"
+W_TYPE = w + "type"
+W_STYLEID = w + "styleId"
+W14_PARAID = w14 + "paraId"
+
+# XPath expressions compiled once, rather than on every call
+WORD_CHILDREN = etree.XPath("w:*", namespaces=NAMESPACES)
+HAS_FORMATTING = etree.XPath("boolean(.//w:pStyle | .//w:pPr/w:*)", namespaces=NAMESPACES)
+
+# what differs between rewriting the formatting of a paragraph and of a run
+PARAGRAPH_KIND = {"wType": "p", "styleType": "paragraph", "props": W_PPR, "propsName": "pPr", "style": W_PSTYLE,
+                  "findProps": ".//" + W_PPR, "findStyle": ".//" + W_PSTYLE, "modified": "paragraphs_modified",
+                  "formatting": etree.XPath(".//w:pPr/w:*[not(self::w:pStyle)]", namespaces=NAMESPACES)}
+RUN_KIND = {"wType": "r", "styleType": "character", "props": W_RPR, "propsName": "rPr", "style": W_RSTYLE,
+            "findProps": ".//" + W_RPR, "findStyle": ".//" + W_RSTYLE, "modified": "runs_modified",
+            "formatting": etree.XPath(".//w:rPr/w:*[not(self::w:rStyle)]", namespaces=NAMESPACES)}
+
+WORD_E = ElementMaker(namespace="http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+                      nsmap={'mc' : "http://schemas.openxmlformats.org/markup-compatibility/2006",
+                             'r' : "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+                             'w' : "http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+                             'w14' : "http://schemas.microsoft.com/office/word/2010/wordml"})
+
+# everything the paragraph rewrite needs to track in styles.xml: the styles
+# root, the styleId index, the synthesized styles by formatting signature
+# and the new styles themselves, by styleId, as well as counts of what the
+# rewrite has done (see newProfile). this also adds the paraid style.
+def getStyleRegistry(styles_root):
+  registry = {"root": styles_root, "index": getStyleIndex(styles_root), "signatures": {}, "new": {},
+              "counters": {"paragraphs_scanned": 0, "paragraphs_modified": 0, "runs_scanned": 0, "runs_modified": 0,
+                           "styles_synthesized": 0, "styles_reused": 0}}
+
+  #create our paraid style
+  newstylename = "HED-dataID"
+  STYLEOBJ = WORD_E.style
+  STYLENAMEOBJ = WORD_E.name
+  RPROBJ = WORD_E.rPr
+
+  newstyle = STYLEOBJ(
+    STYLENAMEOBJ(),
+    RPROBJ()
+  )
+
+  newstyle.set("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type", "character")
+  newstyle.set("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}styleId", newstylename)
+  newstyle.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}name").set("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val", newstylename)
+  styles_root.append(newstyle)
+  registry["index"][newstylename] = newstyle
+  registry["new"][newstylename] = newstyle
+  return registry
+
+# move the direct formatting on a paragraph or run (as described by kind)
+# into a synthesized style in the registry, and return its pStyle or
+# rStyle, if it has one by the end. everything is looked up once: the
+# formatting through the kind's precompiled XPath, and the properties and
+# style elements are kept hold of as they are found or created.
+def rewriteFormatting(el, kind, registry):
+  counters = registry["counters"]
+  # get all formatting on the element (inside its pPr or rPr)
+  formatting = kind["formatting"](el)
+  style = el.find(kind["findStyle"])
+  if not formatting:
+    return style
+  props = el.find(kind["findProps"])
+  stylename = style.get(W_VAL) if style is not None else None
+  signature = getFormatSignature(kind["wType"], stylename, formatting)
+  if signature in registry["signatures"]:
+    # the same formatting on the same style has been seen before,
+    # so reuse the style synthesized for it then
+    newstylename, leftovers = registry["signatures"][signature]
+    replaceFormatting(formatting, leftovers)
+    counters[kind["modified"]] += 1
+    counters["styles_reused"] += 1
+    if style is None:
+      style = etree.Element(kind["style"], nsmap=NSMAP)
+      props.append(style)
+    style.set(W_VAL, newstylename)
+    return style
+
+  parents = [format.getparent() for format in formatting]
+  if style is not None:
+    newstylename = getSyntheticName(stylename, signature, registry)
+    newstyle = deepcopy(registry["index"].get(stylename))
+    basedOn = newstyle.find(W_BASEDON)
+    if basedOn is not None:
+      basedOn.set(W_VAL, stylename)
+    else:
+      basedOn = etree.Element(W_BASEDON, nsmap=NSMAP)
+      basedOn.set(W_VAL, stylename)
+      newstyle.find(W_NAME).addnext(basedOn)
+    styleProps = newstyle.find(kind["props"])
+    if styleProps is None:
+      styleProps = etree.Element(kind["props"], nsmap=NSMAP)
+      newstyle.append(styleProps)
+  else:
+    # add the pStyle or rStyle element to the element
+    if props is None:
+      props = etree.Element(kind["props"], nsmap=NSMAP)
+      el.insert(0, props)
+    style = etree.Element(kind["style"], nsmap=NSMAP)
+    props.append(style)
+
+    newstylename = getSyntheticName(None, signature, registry)
+    styleProps = WORD_E(kind["propsName"])
+    newstyle = WORD_E.style(
+      WORD_E.name(),
+      styleProps
+    )
+    newstyle.set(W_TYPE, kind["styleType"])
+
+  # point the element at the new style
+  style.set(W_VAL, newstylename)
+  # create new style
+  newstyle.set(W_STYLEID, newstylename)
+  newstyle.find(W_NAME).set(W_VAL, newstylename)
+  for format in formatting:
+    currel = styleProps.find(format.tag)
+    if currel is not None:
+      # copy over just the parts of the element that are different from the existing version
+      for att in format.attrib:
+        currel.set(att, format.attrib[att])
+      for child in WORD_CHILDREN(format):
+        currchild = currel.find(child.tag)
+        if currchild is not None:
+          for att in child.attrib:
+            currchild.set(att, child.attrib[att])
+        else:
+          currel.append(child)
+    elif format.tag == W_RPR:
+      currel = newstyle.find(W_RPR)
+      for att in format.attrib:
+        currel.set(att, format.attrib[att])
+    else:
+      styleProps.append(format)
+  # add new style to list
+  registry["root"].append(newstyle)
+  registry["index"][newstylename] = newstyle
+  registry["new"][newstylename] = newstyle
+  registry["signatures"][signature] = newstylename, getLeftovers(formatting, parents)
+  counters[kind["modified"]] += 1
+  counters["styles_synthesized"] += 1
+  return style
+
+# move the direct formatting on a paragraph and its runs into synthesized
+# styles in the registry, and tag the paragraph with its paraid
+def rewriteParagraph(para, registry):
+  counters = registry["counters"]
+  counters["paragraphs_scanned"] += 1
+  # get the paragraph id (for mapping back)
+  para_id = para.get(W14_PARAID)
+  style = rewriteFormatting(para, PARAGRAPH_KIND, registry)
+  for run in para.findall(W_R):
+    counters["runs_scanned"] += 1
+    rewriteFormatting(run, RUN_KIND, registry)
+  # add the para id onto the new stylename
+  if style is not None:
+    newrun = etree.Element(W_R, nsmap=NSMAP)
+    newrpr = etree.Element(W_RPR, nsmap=NSMAP)
+    newtxt = etree.Element(w + "t", nsmap=NSMAP)
+    newrstyle = etree.Element(W_RSTYLE, nsmap=NSMAP)
+
+    newrstyle.set(W_VAL, "HED-dataID")
+    newtxt.text = para_id
+    newrpr.append(newrstyle)
+    newrun.append(newrpr)
+    newrun.append(newtxt)
+    para.append(newrun)
+  return para
+
+# run this function before style map and getting style defs
+# (pass a registry to add to an existing one rather than
+# starting from the styles.xml in myfile)
+def getDirectFormatting(myfile, registry=None):
+  source = getWordText(myfile)
+
+  if registry is None:
+    styles_source = getWordStyles(myfile)
+    registry = getStyleRegistry(etree.fromstring(styles_source))
+
+  root = rewritePart(source, registry)
+  return root, registry["root"]
+
+# rewrite every paragraph in a WordprocessingML part (the document, the
+# footnotes, ...) and return the part's root
+def rewritePart(partSource, registry):
+  root = etree.fromstring(partSource)
+  for para in root.findall(".//" + W_P):
+    rewriteParagraph(para, registry)
+  return root
+
+# the relationship types of the parts other than word/document.xml that
+# mammoth renders, and so need the same rewrite. (mammoth leaves headers
+# and footers out of its HTML altogether.)
+renderedPartTypes = ("footnotes", "endnotes", "comments")
+
+# the names of those parts in the package, in the order of the
+# document's relationships
+def getRenderedParts(source):
+  try:
+    rels = etree.fromstring(source.read('word/_rels/document.xml.rels'))
+  except KeyError:
+    return []
+  partNames = []
+  for rel in rels:
+    if rel.get("Type", "").rsplit("/", 1)[-1] not in renderedPartTypes or rel.get("TargetMode") == "External":
+      continue
+    target = rel.get("Target")
+    if target.startswith("/"):
+      partName = target[1:]
+    else:
+      partName = posixpath.normpath(posixpath.join("word", target))
+    if partName in source.NameToInfo and partName not in partNames:
+      partNames.append(partName)
+  return partNames
+
+# the rewrite of one part in a worker process, against a styles.xml of its
+# own. the part comes back serialized, along with what the rewrite added to
+# the registry: each synthesized style with its signature and leftovers
+# (see getLeftovers), serialized, and the counters.
+def rewritePartSource(partSource, stylesSource):
+  registry = getStyleRegistry(etree.fromstring(stylesSource))
+  root = rewritePart(partSource, registry)
+  newStyles = []
+  for signature, (newstylename, leftovers) in registry["signatures"].items():
+    newStyles.append((signature, newstylename, [etree.tostring(leftover) for leftover in leftovers],
+                      etree.tostring(registry["index"][newstylename])))
+  return etree.tostring(root, encoding="UTF-8", standalone=True, xml_declaration=True), newStyles, registry["counters"]
+
+# add the styles synthesized by a worker to the registry. synthesized style
+# names come from the formatting signature (see getSyntheticName), so the
+# same formatting has been given the same name in every part, and each style
+# only goes into styles.xml once.
+def mergeSynthesizedStyles(registry, newStyles, counters):
+  merged = 0
+  for signature, newstylename, leftovers, style in newStyles:
+    if signature in registry["signatures"]:
+      continue
+    if newstylename not in registry["index"]:
+      style = etree.fromstring(style)
+      registry["root"].append(style)
+      registry["index"][newstylename] = style
+      registry["new"][newstylename] = style
+      merged += 1
+    registry["signatures"][signature] = newstylename, [etree.fromstring(leftover) for leftover in leftovers]
+  # a style another part synthesized first counts as reused
+  counters = dict(counters)
+  counters["styles_reused"] += counters["styles_synthesized"] - merged
+  counters["styles_synthesized"] = merged
+  for name, count in counters.items():
+    registry["counters"][name] += count
+
+# the pools of part workers, one for each number of workers asked for,
+# started the first time a document needs one and kept for the rest of
+# the process, so that a batch of documents only pays once for starting
+# the workers and importing lxml and mammoth into them. a pool is never
+# shut down while conversions in other threads may still be using it.
+# there are never more parts than the document and its rendered parts.
+partPools = {}
+partPoolsLock = threading.Lock()
+
+def getPartPool(workers):
+  workers = min(workers, len(renderedPartTypes) + 1)
+  with partPoolsLock:
+    executor = partPools.get(workers)
+    if executor is None:
+      executor = partPools[workers] = ProcessPoolExecutor(max_workers=workers)
+      # shut the pool down before multiprocessing waits for the children of
+      # an exiting process, as it does in the worker processes of a batch.
+      # this has to come before the pool's queues close themselves (at
+      # priority 10), or the workers never get told to stop
+      multiprocessing.util.Finalize(None, executor.shutdown, exitpriority=100)
+  return executor
+
+# rewrite the given parts of the package: in the pool of part workers if
+# workers > 1, one part per task, or else one after the other. returns
+# the rewritten parts, serialized, by name; the synthesized styles are all
+# merged into the registry.
+def rewriteParts(source, partNames, registry, stylesSource, workers=1):
+  rewritten = {}
+  if workers > 1 and len(partNames) > 1:
+    executor = getPartPool(workers)
+    futures = [executor.submit(rewritePartSource, source.read(partName), stylesSource) for partName in partNames]
+    # merge in part order, so the styles come out the same every time
+    for partName, future in zip(partNames, futures):
+      partxml, newStyles, counters = future.result()
+      mergeSynthesizedStyles(registry, newStyles, counters)
+      rewritten[partName] = partxml
+  else:
+    for partName in partNames:
+      root = rewritePart(source.read(partName), registry)
+      rewritten[partName] = etree.tostring(root, encoding="UTF-8", standalone=True, xml_declaration=True)
+  return rewritten
+
+# serialize el on its own, leaving out the namespace declarations it
+# inherits from the document element (nsdecls), as those are in scope
+# already wherever el is written
+def serializeBlock(el, nsdecls):
+  data = etree.tostring(el, encoding="UTF-8")
+  if nsdecls:
+    data = data.replace(nsdecls, b"", 1)
+  return data
+
+# the start and end tags of a container element, given an empty copy of
+# it in the skeleton document
+def serializeTags(el, nsdecls):
+  el.append(etree.Comment("HED-split"))
+  if el.getparent() is None:
+    data = etree.tostring(el, encoding="UTF-8", standalone=True, xml_declaration=True)
+  else:
+    data = serializeBlock(el, nsdecls)
+  el.remove(el[0])
+  return data.split(b"<!--HED-split-->")
+
+# the streaming version of getDirectFormatting: word/document.xml is read
+# from the source zip and written to outfile one top-level block (a
+# paragraph, a table, ...) at a time. each block is rewritten, written
+# out and freed before the next is parsed, so memory use stays flat
+# however long the document is.
+def streamDirectFormatting(source, registry, outfile):
+  root = None
+  body = None
+  docfile = source.open('word/document.xml')
+  for event, el in etree.iterparse(docfile, events=("start", "end")):
+    if event == "start":
+      if root is None:
+        root = el
+        # an empty copy of the document element; a block serialized on its
+        # own repeats all of its namespace declarations, and serializing a
+        # probe element shows exactly what that repeated run looks like
+        skeleton = etree.Element(el.tag, dict(el.attrib), nsmap=el.nsmap)
+        probe = etree.tostring(etree.SubElement(skeleton, el.tag), encoding="UTF-8")
+        skeleton.remove(skeleton[0])
+        nsdecls = probe[len(probe.split(None, 1)[0]):-2]
+        head, tail = serializeTags(skeleton, nsdecls)
+        outfile.write(head)
+      elif body is None and el.tag == "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}body" and el.getparent() is root:
+        body = el
+        bodyhead, bodytail = serializeTags(etree.SubElement(skeleton, el.tag, dict(el.attrib)), nsdecls)
+        outfile.write(bodyhead)
+      continue
+
+    if el is root:
+      outfile.write(tail)
+    elif el is body:
+      outfile.write(bodytail)
+    elif el.getparent() is body or el.getparent() is root:
+      for para in list(el.iter(W_P)):
+        rewriteParagraph(para, registry)
+      outfile.write(serializeBlock(el, nsdecls))
+      # free the block, and the blocks before it
+      el.clear()
+      while el.getprevious() is not None:
+        del el.getparent()[0]
+  docfile.close()
+
+# serialize an XML part into outfile
+def writeXML(root, outfile):
+  outfile.write(etree.tostring(root, encoding="UTF-8", standalone=True, xml_declaration=True))
+
+# the mod suffix (and its number) at the end of a class name
+suffixPattern = re.compile(suffix + '[0-9]+$')
+
+# all the HTML post-processing, done in a single walk over the tree:
+# each element picks up the data-source-id from its HED-dataID run,
+# p and span elements get the attributes for their class from myDict,
+# and the mod suffix is deleted from class names.
+# the number of elements walked, and of each kind of change, is added to
+# counters, if given.
+# given a styles dict, the attributes are collected into it by class name
+# instead of going onto the elements, and the elements keep their full
+# class name (the one with the mod suffix) as a second class, to look them
+# up by
+def processHTML(root, myDict, counters=None, styles=None):
+  idRuns = []
+  elements = 0
+  attributed = 0
+  renamed = 0
+  for el in root.iter(tag=etree.Element):
+    elements += 1
+    # the id goes on before any other attribute
+    for child in el:
+      if child.tag == "span" and child.get("class") == "HED-dataID":
+        el.set("data-source-id", child.text)
+        idRuns.append(child)
+    classname = el.get("class")
+    if classname is None or classname == "HED-dataID":
+      continue
+    if el.tag == "p" or el.tag == "span":
+      vals = myDict.get(classname)
+      if vals is not None:
+        attributed += 1
+        if styles is None:
+          for key, val in vals.items():
+            el.attrib[key] = val
+        else:
+          styles[classname] = vals
+    if suffix in classname:
+      renamed += 1
+      baseclass = suffixPattern.sub('', classname)
+      if styles is not None and classname in styles:
+        # a style synthesized from no style at all has no base class
+        el.set("class", baseclass + " " + classname if baseclass else classname)
+      else:
+        el.set("class", baseclass)
+  for run in idRuns:
+    run.getparent().remove(run)
+  if counters is not None:
+    for name, count in (("html_elements", elements), ("html_ids", len(idRuns)), ("html_attributed", attributed), ("html_renamed", renamed)):
+      counters[name] = counters.get(name, 0) + count
+  return root
+
+# add the formatting info back to the HTML as attributes on each element
+# (or, given a styles dict, collect it there; see processHTML).
+# convert no longer goes through this or sanitizeHTML, as it runs
+# processHTML on the tree it already has; they are kept for callers that
+# post-process an HTML string of their own
+def addAttrs(html, myDict, counters=None, styles=None):
+  root = etree.HTML(html)
+  processHTML(root, myDict, counters, styles)
+  newHTML = etree.tostring(root, standalone=True, xml_declaration=True)
+  return newHTML
+
+# write the HTML tree to outfile a piece at a time, the same bytes as
+# etree.tostring would make of it all at once: each child of the body is
+# serialized, written and dropped from the tree in turn, so the whole
+# document never exists as a string. returns the number of bytes written.
+def writeHTML(root, outfile):
+  body = root.find("body")
+  if body is None or len(root) != 1:
+    data = etree.tostring(root, standalone=True, xml_declaration=True)
+    outfile.write(data)
+    return len(data)
+  # the tags around the body's children, from an empty copy of the tree
+  skeleton = etree.Element(root.tag, dict(root.attrib))
+  skeleton.text = root.text
+  skeletonBody = etree.SubElement(skeleton, body.tag, dict(body.attrib))
+  skeletonBody.text = body.text
+  skeletonBody.tail = body.tail
+  skeletonBody.append(etree.Comment("HED-split"))
+  head, tail = etree.tostring(skeleton, standalone=True, xml_declaration=True).split(b"<!--HED-split-->")
+  outfile.write(head)
+  written = len(head) + len(tail)
+  while len(body):
+    data = etree.tostring(body[0])
+    outfile.write(data)
+    written += len(data)
+    del body[0]
+  outfile.write(tail)
+  return written
+
+# delete the mod suffix from the class names in an HTML string, and move
+# the data-source-ids onto their elements (see addAttrs)
+def sanitizeHTML(html, counters=None):
+  root = etree.HTML(html)
+  processHTML(root, {}, counters)
+  newHTML = etree.tostring(root, standalone=True, xml_declaration=True)
+  return newHTML
+
+# rebuild the docx on disk: extract it into workDir (a fresh temporary
+# directory owned by this conversion), write the rewritten parts into
+# the extracted tree and re-zip it
+def rebuildDocx(myfile, parts, workDir):
+  filePath = os.path.join(workDir, "docx")
+  unZip(myfile, filePath)
+
+  for name, data in parts.items():
+    # write to a new document
+    partfile = open(os.path.join(filePath, *name.split("/")), 'wb')
+    writePart(partfile, data)
+    partfile.close()
+
+  newZipName = os.path.join(workDir, "docx.zip")
+
+  zipDocx(filePath, newZipName)
+  return newZipName
+
+# the mammoth style map lines that keep the source style names as classes
+def getStyleMapLines(verboseAttrs):
+  lines = []
+  for style, vals in verboseAttrs.items():
+    sourceName = vals['data-name']
+    destName = style
+    # mapping paragraphs
+    if vals['data-w-type'] == 'p':
+      thisMap = "p[style-name='" + sourceName + "'] => p." + destName + ":fresh"
+    # mapping runs
+    else:
+      thisMap = "r[style-name='" + sourceName + "'] => span." + destName
+    # write this map to the map file
+    lines.append(thisMap)
+  return lines
+
+# create the mammoth style map, adding to any lines already made
+def getStyleMap(verboseAttrs, baseLines=()):
+  lines = list(baseLines) + getStyleMapLines(verboseAttrs)
+  return '"""\n' + "\n".join(lines) + '\n"""'
+
+# write each image to imageDir, named by the SHA-256 of its content, instead
+# of inlining it into the HTML as a data URI. an image that is already in
+# imageDir (from this document or any other) isn't written again.
+# the src of each img is the file name under imageURL, or under imageDir
+# if no URL is given. counts of the images written and reused are kept in
+# counters.
+def getImageConverter(imageDir, imageURL=None, counters=None):
+  if imageURL is None:
+    imageURL = imageDir.replace(os.sep, "/")
+  if counters is None:
+    counters = {}
+  counters.setdefault("images_written", 0)
+  counters.setdefault("images_reused", 0)
+
+  def convertImage(image):
+    with image.open() as imageBytes:
+      data = imageBytes.read()
+    subtype = image.content_type.split("/")[-1]
+    extension = mimetypes.guess_extension(image.content_type) or "." + re.sub('[^a-z0-9]', '', subtype.lower())
+    imageName = hashlib.sha256(data).hexdigest() + extension
+    imagePath = os.path.join(imageDir, imageName)
+    if os.path.exists(imagePath):
+      counters["images_reused"] += 1
+    else:
+      os.makedirs(imageDir, exist_ok=True)
+      writeAtomic(imagePath, data)
+      counters["images_written"] += 1
+    return {"src": posixpath.join(imageURL, imageName)}
+
+  return mammoth.images.img_element(convertImage)
+
+# profiling. a profile collects, for each stage of a conversion, the wall
+# and CPU time spent in it, the process's peak RSS once it's done and how
+# far the stage pushed that peak up; and counts of the work done, from the
+# rewrite (see getStyleRegistry) and the HTML post-processing (see
+# processHTML). time spent in a stage nested inside another (the rewrite,
+# when it's streamed into the package) only counts towards the inner one.
+def newProfile():
+  return {"stages": {}, "counters": {}, "stack": [], "start": (time.perf_counter(), time.process_time())}
+
+# the peak resident set size of the process so far, in bytes
+def getPeakRSS():
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes on Linux, bytes on macOS
+  return peak if sys.platform == "darwin" else peak * 1024
+
+# time the code in the with block as a stage of the conversion
+# (profile may be None, in which case nothing is recorded)
+@contextlib.contextmanager
+def profileStage(profile, name):
+  if profile is None:
+    yield
+    return
+  stack = profile["stack"]
+  startRSS = getPeakRSS()
+  wall = time.perf_counter()
+  cpu = time.process_time()
+  stack.append([0.0, 0.0])
+  try:
+    yield
+  finally:
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    nestedWall, nestedCPU = stack.pop()
+    if stack:
+      stack[-1][0] += wall
+      stack[-1][1] += cpu
+    peakRSS = getPeakRSS()
+    stage = profile["stages"].setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_rss": None, "rss_growth": None})
+    stage["calls"] += 1
+    stage["wall"] += wall - nestedWall
+    stage["cpu"] += cpu - nestedCPU
+    if peakRSS is not None:
+      stage["peak_rss"] = peakRSS
+      stage["rss_growth"] = (stage["rss_growth"] or 0) + peakRSS - startRSS
+
+# a function that runs function as a stage of the conversion
+def profiled(profile, name, function):
+  def run(*args, **kwargs):
+    with profileStage(profile, name):
+      return function(*args, **kwargs)
+  return run
+
+# add counts to the profile's counters
+def addCounters(profile, counters):
+  if profile is not None:
+    for name, count in counters.items():
+      profile["counters"][name] = profile["counters"].get(name, 0) + count
+
+# the finished profile, ready to be turned into JSON
+def getProfileReport(profile, options):
+  startWall, startCPU = profile["start"]
+  return {"options": dict((key, value) for key, value in options.items() if key != "profile"),
+          "wall": time.perf_counter() - startWall, "cpu": time.process_time() - startCPU, "peak_rss": getPeakRSS(),
+          "stages": profile["stages"], "counters": profile["counters"], "html_bytes": profile.get("html_bytes")}
+
+# incremental re-conversion. the body of the document is cut into
+# segments, each one ending with a top-level paragraph that will carry a
+# data-source-id (its anchor); in the HTML, a segment is everything after
+# the previous anchor's element, up to and including its own. the state
+# file keeps each segment's content hash and HTML from the last run, so
+# only the segments that have changed since go through the rewrite and
+# mammoth again; the rest of the HTML is spliced back in from the state.
+
+# whether a top-level block of the body will carry a data-source-id:
+# rewriteParagraph tags every paragraph with a paraid that has, or is
+# given, a paragraph style
+def isAnchor(block):
+  if block.tag != W_P or block.get(W14_PARAID) is None:
+    return False
+  return HAS_FORMATTING(block)
+
+# cut the document body into segments. returns None when the document
+# can't be converted piecemeal: notes and comments are numbered and
+# collected across the whole document.
+def getSegments(root):
+  body = root.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}body")
+  if body is None:
+    return None
+  for reference in root.iter("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}footnoteReference",
+                             "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}endnoteReference",
+                             "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}commentReference"):
+    return None
+
+  segments = []
+  blocks = []
+  for block in body:
+    # the section properties go with every conversion
+    if block.tag == "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sectPr":
+      continue
+    blocks.append(block)
+    if isAnchor(block):
+      segments.append({"id": block.get("{http://schemas.microsoft.com/office/word/2010/wordml}paraId"), "blocks": blocks})
+      blocks = []
+  # whatever follows the last anchor
+  if blocks:
+    segments.append({"id": None, "blocks": blocks})
+
+  for segment in segments:
+    segmentHash = hashlib.sha1()
+    for block in segment["blocks"]:
+      segmentHash.update(etree.tostring(block, method="c14n"))
+    segment["hash"] = segmentHash.hexdigest()
+  return segments
+
+# everything besides the body that the HTML of a segment depends on: the
+# conversion options, every other part of the package (by CRC) and the
+# document element's attributes
+def getIncrementalContext(source, root, options):
+  parts = [(info.filename, info.CRC, info.file_size) for info in source.infolist() if info.filename != 'word/document.xml']
+  context = [sorted(options.items()), parts, sorted(root.attrib.items())]
+  return hashlib.sha256(json.dumps(context).encode("utf-8")).hexdigest()
+
+# a copy of word/document.xml with only the blocks of the given segments
+def getPartialDocument(root, segments):
+  body = root.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}body")
+  newroot = etree.Element(root.tag, dict(root.attrib), nsmap=root.nsmap)
+  newbody = etree.SubElement(newroot, body.tag, dict(body.attrib))
+  for segment in segments:
+    for block in segment["blocks"]:
+      newbody.append(deepcopy(block))
+  sectPr = body.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sectPr")
+  if sectPr is not None:
+    newbody.append(deepcopy(sectPr))
+  return etree.tostring(newroot, encoding="UTF-8", standalone=True, xml_declaration=True)
+
+# split converted HTML into the fragments for the given segments, by the
+# data-source-id of their anchors. returns None if the HTML doesn't split
+# cleanly, e.g. when an anchor ends up nested inside a list.
+def splitFragments(html, segments):
+  body = etree.fromstring(html).find("body")
+  anchors = [segment["id"] for segment in segments if segment["id"] is not None]
+  fragments = []
+  current = []
+  if body is not None:
+    if body.text:
+      return None
+    for child in body:
+      current.append(etree.tostring(child).decode("ascii"))
+      if len(fragments) < len(anchors) and child.get("data-source-id") == anchors[len(fragments)]:
+        fragments.append("".join(current))
+        current = []
+  if len(fragments) < len(anchors):
+    return None
+  # the HTML after the last anchor belongs to the trailing segment, if any
+  if segments and segments[-1]["id"] is None:
+    fragments.append("".join(current))
+  elif current:
+    return None
+  return fragments
+
+# the HTML document around the fragments
+def getHTMLWrapper():
+  head, tail = etree.tostring(E.html(E.body(etree.Comment("HED-split"))), standalone=True, xml_declaration=True).split(b"<!--HED-split-->")
+  return head, tail
+
+# (profile is the profile that the conversions are recorded in, or None)
+def convertIncremental(path_or_bytes, statePath, profile=None, **options):
+  if isinstance(path_or_bytes, (bytes, bytearray)):
+    fobj = io.BytesIO(path_or_bytes)
+  else:
+    fobj = open(path_or_bytes, 'rb')
+
+  try:
+    with profileStage(profile, "segment"):
+      source = zipfile.ZipFile(fobj)
+      root = etree.fromstring(source.read('word/document.xml'))
+      segments = getSegments(root)
+      if segments is not None:
+        context = getIncrementalContext(source, root, options)
+      source.close()
+    if segments is None:
+      fobj.seek(0)
+      return convertPackage(fobj.read(), profile, **options)
+
+    # the fragments from the last run, if it was made in the same context,
+    # the styles of compact output (see convert) and mammoth's messages
+    fragments = {}
+    styles = {}
+    messages = []
+    try:
+      statefile = open(statePath)
+      try:
+        state = json.load(statefile)
+      finally:
+        statefile.close()
+      if state["context"] == context:
+        for segment in state["segments"]:
+          fragments[segment["id"], segment["hash"]] = segment["html"]
+        styles = state.get("styles", {})
+        messages = [mammoth.results.Message(*message) for message in state.get("messages", [])]
+    except (OSError, ValueError, KeyError, TypeError):
+      pass
+
+    changed = [segment for segment in segments if (segment["id"], segment["hash"]) not in fragments]
+    addCounters(profile, {"segments": len(segments), "segments_changed": len(changed)})
+    result = None
+    if changed and len(changed) < len(segments):
+      with profileStage(profile, "segment"):
+        partial = buildDocx(fobj, {'word/document.xml': getPartialDocument(root, changed)})
+      result = convertPackage(partial.getvalue(), profile, **options)
+      newFragments = splitFragments(result.value, changed)
+      if newFragments is None:
+        result = None
+      else:
+        for segment, fragment in zip(changed, newFragments):
+          fragments[segment["id"], segment["hash"]] = fragment
+        styles.update(getattr(result, "styles", {}))
+        # mammoth's messages can't be traced back to segments, so the
+        # messages of the unchanged ones are kept along with the new ones
+        # (the result drops the duplicates)
+        messages = messages + result.messages
+    elif not changed:
+      result = mammoth.results.Result(None, messages)
+    if result is None:
+      # convert the whole document
+      fobj.seek(0)
+      result = convertPackage(fobj.read(), profile, **options)
+      newFragments = splitFragments(result.value, segments)
+      if newFragments is None:
+        return result
+      fragments = dict(zip([(segment["id"], segment["hash"]) for segment in segments], newFragments))
+      styles = getattr(result, "styles", {})
+      messages = result.messages
+  finally:
+    fobj.close()
+
+  # splice the fragments back together, and keep them for next time
+  with profileStage(profile, "splice"):
+    html = []
+    stateSegments = []
+    for segment in segments:
+      fragment = fragments[segment["id"], segment["hash"]]
+      html.append(fragment)
+      stateSegments.append({"id": segment["id"], "hash": segment["hash"], "html": fragment})
+    html = "".join(html)
+
+    if styles:
+      # only keep the styles of the classes still in use
+      classes = set()
+      for classnames in re.findall('class="([^"]*)"', html):
+        classes.update(classnames.split())
+      styles = dict((classname, vals) for classname, vals in styles.items() if classname in classes)
+    messages = mammoth.results.Result(None, messages).messages
+    writeAtomic(statePath, json.dumps({"context": context, "segments": stateSegments, "styles": styles,
+                                       "messages": [[message.type, message.message] for message in messages]}).encode("utf-8"))
+
+    head, tail = getHTMLWrapper()
+    html = head + html.encode("ascii") + tail
+  result = mammoth.results.Result(html, messages)
+  if options.get("verbose") and options.get("compact"):
+    result.styles = styles
+  return result
+
+# convert a docx (given as a path or as the raw bytes) to HTML.
+# returns a mammoth result: the HTML bytes are in result.value
+# and the conversion warnings in result.messages.
+# with stream=True, word/document.xml is rewritten one block at a time
+# (see streamDirectFormatting) and the rebuilt package spills over to an
+# anonymous temporary file once it outgrows memory.
+# with a cache_dir, the parsed template styles are kept there between runs
+# (see readStyleCache), up to cache_size bytes.
+# with incremental set to the path of a state file, only the parts of the
+# document that changed since the last conversion with that state file
+# are converted again (see convertIncremental).
+# with profile set to a function, the conversion is profiled (see
+# newProfile) and the function is called with the report once it's done.
+# with an image_dir, images are written there rather than inlined into the
+# HTML, and linked to under image_url (see getImageConverter).
+# with verbose and compact=True, the formatting of each class is written
+# once, into the dict result.styles (class name -> attributes), instead of
+# onto every element with that class.
+# with verbose and resolve_styles=True, the attributes describe the effective
+# formatting of each style, inherited formatting included, rather than just
+# the style's own (see getResolvedStyleIndex).
+# with part_workers > 1, the document, footnotes, endnotes and comments are
+# rewritten in that many worker processes at once (see rewriteParts).
+# given an output (a binary file-like object: a file, sys.stdout.buffer, a
+# socket's makefile("wb"), ...), the HTML is written to it as it's
+# serialized, and result.value is None.
+def convert(path_or_bytes, map_styles=True, verbose=False, on_disk=False, stream=False, cache_dir=None, cache_size=cacheSize, incremental=None,
+            profile=None, image_dir=None, image_url=None, compact=False, resolve_styles=False, part_workers=1, output=None):
+  options = {"map_styles": map_styles, "verbose": verbose, "on_disk": on_disk, "stream": stream,
+             "cache_dir": cache_dir, "cache_size": cache_size, "image_dir": image_dir, "image_url": image_url, "compact": compact,
+             "resolve_styles": resolve_styles, "part_workers": part_workers}
+  report = newProfile() if profile is not None else None
+  if incremental is not None:
+    # the fragments have to be spliced together first
+    result = convertIncremental(path_or_bytes, incremental, report, **options)
+    if report is not None:
+      report["html_bytes"] = len(result.value)
+    if output is not None:
+      output.write(result.value)
+      result.value = None
+  else:
+    result = convertPackage(path_or_bytes, report, output=output, **options)
+  if profile is not None:
+    profile(getProfileReport(report, dict(options, incremental=incremental)))
+  return result
+
+# the conversion itself (see convert), recording it in profile if given
+def convertPackage(path_or_bytes, profile, map_styles=True, verbose=False, on_disk=False, stream=False, cache_dir=None, cache_size=cacheSize,
+                   image_dir=None, image_url=None, compact=False, resolve_styles=False, part_workers=1, output=None):
+  if isinstance(path_or_bytes, (bytes, bytearray)):
+    fobj = io.BytesIO(path_or_bytes)
+  else:
+    fobj = open(path_or_bytes, 'rb')
+
+  workDir = None
+  try:
+    with profileStage(profile, "read"):
+      source = zipfile.ZipFile(fobj)
+      stylesSource = source.read('word/styles.xml')
+      styles_root = etree.fromstring(stylesSource)
+
+    # the verbose attributes and style map lines for the template's own
+    # styles, from the cache if this styles.xml has been seen before
+    with profileStage(profile, "styles"):
+      baseStyles = None
+      if cache_dir is not None:
+        baseStyles = readStyleCache(cache_dir, stylesSource)
+        addCounters(profile, {"style_cache_hits": int(baseStyles is not None)})
+      if baseStyles is None:
+        allStyles = getStyleAttrs(getStyleIndex(styles_root))
+        baseStyles = {"styles": allStyles, "style_map": getStyleMapLines(allStyles)}
+        if cache_dir is not None:
+          writeStyleCache(cache_dir, stylesSource, baseStyles, cache_size)
+
+    with profileStage(profile, "rewrite"):
+      registry = getStyleRegistry(styles_root)
+      # the footnotes, endnotes and comments get the same rewrite
+      otherParts = getRenderedParts(source)
+    if stream:
+      with profileStage(profile, "rewrite"):
+        rewritten = rewriteParts(source, otherParts, registry, stylesSource, part_workers)
+      # the document has to be streamed before the styles are written: it
+      # adds to them
+      parts = {"word/document.xml": profiled(profile, "rewrite", functools.partial(streamDirectFormatting, source, registry))}
+      parts.update(rewritten)
+      parts["word/styles.xml"] = profiled(profile, "serialize", functools.partial(writeXML, registry["root"]))
+    else:
+      with profileStage(profile, "rewrite"):
+        if part_workers > 1 and otherParts:
+          # the worker processes serialize the parts as well
+          parts = rewriteParts(source, ["word/document.xml"] + otherParts, registry, stylesSource, part_workers)
+          roots = {}
+        else:
+          parts = {}
+          roots = {"word/document.xml": getDirectFormatting(fobj, registry)[0]}
+          for partName in otherParts:
+            roots[partName] = rewritePart(source.read(partName), registry)
+
+      with profileStage(profile, "serialize"):
+        for partName, root in roots.items():
+          parts[partName] = etree.tostring(root, encoding="UTF-8", standalone=True, xml_declaration=True)
+        parts["word/styles.xml"] = etree.tostring(registry["root"], encoding="UTF-8", standalone=True, xml_declaration=True)
+
+    with profileStage(profile, "package"):
+      if on_disk:
+        workDir = tempfile.mkdtemp(prefix="mammoth-verbose-")
+        newZipName = rebuildDocx(fobj, parts, workDir)
+        newdocx = open(newZipName, 'rb')
+      elif stream:
+        newdocx = buildDocx(fobj, parts, tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024))
+      else:
+        newdocx = buildDocx(fobj, parts)
+      source.close()
+      fobj.close()
+      fobj = newdocx
+    addCounters(profile, registry["counters"])
+
+    with profileStage(profile, "style map"):
+      # only the styles synthesized for this document are new
+      newStyles = getStyleAttrs(registry["new"])
+      if verbose and resolve_styles:
+        # the styles synthesized for unstyled paragraphs and runs inherit
+        # from the default styles, like the paragraphs and runs themselves
+        defaultBased = [styleID for styleID, style in registry["new"].items()
+                        if style.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}basedOn") is None]
+        verboseAttrs = getStyleAttrs(getResolvedStyleIndex(registry["root"], registry["index"], defaultBased))
+      else:
+        verboseAttrs = mergeStyles(baseStyles["styles"], newStyles)
+
+      options = {}
+      # create the style map if requested
+      if map_styles:
+        options["style_map"] = getStyleMap(newStyles, baseStyles["style_map"])
+
+    imageCounters = {}
+    if image_dir is not None:
+      options["convert_image"] = getImageConverter(image_dir, image_url, imageCounters)
+
+    # convert with mammoth
+    with profileStage(profile, "mammoth"):
+      result = mammoth.convert_to_html(fobj, **options)
+    addCounters(profile, imageCounters)
+  finally:
+    fobj.close()
+    # cleanup
+    if workDir is not None:
+      shutil.rmtree(workDir)
+
+  # add the verbose attributes to the output HTML if requested
+  with profileStage(profile, "postprocess"):
+    counters = {} if profile is not None else None
+    styles = {} if verbose and compact else None
+    root = etree.HTML(result.value)
+    # let go of mammoth's copy of the HTML as soon as it's parsed
+    result = mammoth.results.Result(None, result.messages)
+    processHTML(root, verboseAttrs if verbose else {}, counters, styles)
+    if output is not None:
+      htmlBytes = writeHTML(root, output)
+      html = None
+    else:
+      html = etree.tostring(root, standalone=True, xml_declaration=True)
+      htmlBytes = len(html)
+    del root
+    addCounters(profile, counters)
+    if profile is not None:
+      profile["html_bytes"] = htmlBytes
+
+  result = mammoth.results.Result(html, result.messages)
+  if styles is not None:
+    result.styles = styles
+  return result
+
+# convert one docx and write the HTML next to it, as <name>.html;
+# this is the unit of work handed to the batch workers
+# (options are passed on to convert; incremental=True keeps the
+# incremental state for the file in the cache directory, and
+# profile=True writes the profile next to the HTML, as <name>.profile.json;
+# with stdout=True the HTML goes to the standard output instead)
+def convertFile(fileName, incremental=False, profile=False, stdout=False, **options):
+  outputPath = os.path.splitext(os.path.abspath(fileName))[0] + ".html"
+  if incremental:
+    options["incremental"] = os.path.join(options["cache_dir"], "incremental-" + hashlib.sha256(outputPath.encode("utf-8")).hexdigest() + ".json")
+  if options.get("image_dir") is not None and options.get("image_url") is None:
+    # link to the images relative to the HTML
+    options["image_url"] = os.path.relpath(os.path.abspath(options["image_dir"]), os.path.dirname(outputPath)).replace(os.sep, "/")
+  if profile:
+    def writeProfile(report):
+      report["input"] = os.path.abspath(fileName)
+      writeAtomic(os.path.splitext(outputPath)[0] + ".profile.json", json.dumps(report, indent=2).encode("utf-8"))
+    options["profile"] = writeProfile
+  # write to a new HTML document, as the HTML is serialized
+  results = []
+  def writeOutput(outfile):
+    results.append(convert(fileName, output=outfile, **options))
+  if stdout:
+    writeOutput(sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+  else:
+    writeAtomic(outputPath, writeOutput)
+  result = results[0]
+  if getattr(result, "styles", None) is not None:
+    # the styles of compact output go alongside
+    writeAtomic(os.path.splitext(outputPath)[0] + ".styles.json", json.dumps(result.styles, indent=2, sort_keys=True).encode("utf-8"))
+  return outputPath
+
+# expand the -i arguments into the list of docx files to convert;
+# directories contribute every .docx directly inside them
+def getInputFiles(paths):
+  fileNames = []
+  for path in paths:
+    if os.path.isdir(path):
+      for name in sorted(os.listdir(path)):
+        # skip the lock files Word leaves next to open documents
+        if name.endswith(".docx") and not name.startswith("~$"):
+          fileNames.append(os.path.join(path, name))
+    else:
+      fileNames.append(path)
+  return fileNames
+
+# function to check if the input file is valid
+def is_valid_file(parser, arg):
+  if not os.path.exists(arg):
+    parser.error("The file %s does not exist!" % arg)
+  else:
+    return arg
+
+def main(argv=None):
+  # defining the program options
+  parser = argparse.ArgumentParser(description='While using the Mammoth docx converter, add options to preserve source class names and formatting information as attributes.')
+  parser.add_argument("-i", dest="filenames", nargs="+",
+                      help="The docx files to read, or directories of docx files. Required, unless --serve is given.", metavar="FILE",
+                      type=lambda x: is_valid_file(parser, x))
+  parser.add_argument('--map', dest='mapStyles', action='store_true', default=True,
+                     help='Create a custom map to preserve the source docx style names as classes in the output HTML. Default is True.')
+  parser.add_argument('--verbose', dest='preserveFormatting', action='store_true', default=False,
+                     help='Preserve any formatting applied to the docx styles as attributes in the output HTML. Default is False.')
+  parser.add_argument('--compact', dest='compact', action='store_true', default=False,
+                     help='With --verbose, write the formatting of each class once, to a JSON file next to the output HTML, instead of onto every element. Default is False.')
+  parser.add_argument('--resolve-styles', dest='resolveStyles', action='store_true', default=False,
+                     help='With --verbose, describe the effective formatting of each style, including what it inherits from the styles it is based on and the document defaults. Default is False.')
+  parser.add_argument('--on-disk', dest='onDisk', action='store_true', default=False,
+                     help='Extract the docx into a temporary directory and re-zip it there before converting, instead of rebuilding the package in memory. Default is False.')
+  parser.add_argument('--stream', dest='stream', action='store_true', default=False,
+                     help='Rewrite word/document.xml one paragraph or table at a time instead of loading it whole, to keep memory use flat on very large documents. Default is False.')
+  parser.add_argument('--cache-dir', dest='cacheDir', default=None, metavar="DIR",
+                     help='Keep the parsed template styles in this directory between runs, keyed by the content of styles.xml. Default is no cache.')
+  parser.add_argument('--cache-size', dest='cacheSize', type=int, default=cacheSize // (1024 * 1024), metavar="MB",
+                     help='The size limit of the style cache in megabytes; the least recently used entries are dropped beyond it. Default is %(default)s.')
+  parser.add_argument('--incremental', dest='incremental', action='store_true', default=False,
+                     help='Only re-convert the paragraphs that changed since the last conversion of the same file; the rest of the HTML comes from the cache. Requires --cache-dir. Default is False.')
+  parser.add_argument('--profile', dest='profile', action='store_true', default=False,
+                     help='Write the time and memory taken by each stage of the conversion, and counts of the work done, to a JSON file next to the output HTML. Default is False.')
+  parser.add_argument('--image-dir', dest='imageDir', default=None, metavar="DIR",
+                     help='Write the images to this directory, named by a hash of their content, and link to them from the HTML, instead of inlining them as data URIs. Default is to inline them.')
+  parser.add_argument('--image-url', dest='imageURL', default=None, metavar="URL",
+                     help='With --image-dir, the URL the image files are linked to under. Default is the path of the image directory relative to the HTML.')
+  parser.add_argument('--part-workers', dest='partWorkers', type=int, default=1,
+                     help='The number of worker processes used to rewrite the parts of each document (the body, footnotes, endnotes and comments) at once. Default is %(default)s.')
+  parser.add_argument('--stdout', dest='stdout', action='store_true', default=False,
+                     help='Write the HTML to the standard output rather than next to the input file. Only one input file can be given. Default is False.')
+  parser.add_argument('--workers', dest='workers', type=int, default=os.cpu_count(),
+                     help='The number of worker processes used to convert several files at once. Default is the number of CPUs.')
+
+  parser.add_argument('--serve', dest='serve', default=None, metavar="[HOST:]PORT",
+                     help='Instead of converting files, run a conversion server on this port (of 127.0.0.1, unless a host is given); see mammoth_verbose_server.py.')
+  parser.add_argument('--backlog', dest='backlog', type=int, default=16,
+                     help='With --serve, the number of requests that can wait for a worker; more are turned away. Default is %(default)s.')
+  parser.add_argument('--timeout', dest='timeout', type=float, default=30,
+                     help='With --serve, the time limit for each request, in seconds. Default is %(default)s.')
+
+  args = parser.parse_args(argv)
+  if args.serve is None and not args.filenames:
+    parser.error("the following arguments are required: -i")
+  if args.incremental and args.cacheDir is None:
+    parser.error("--incremental needs a --cache-dir to keep its state in")
+
+  options = {"map_styles": args.mapStyles, "verbose": args.preserveFormatting, "on_disk": args.onDisk, "stream": args.stream,
+             "cache_dir": args.cacheDir, "cache_size": args.cacheSize * 1024 * 1024,
+             "incremental": args.incremental, "profile": args.profile, "image_dir": args.imageDir, "image_url": args.imageURL,
+             "compact": args.compact, "resolve_styles": args.resolveStyles, "part_workers": args.partWorkers}
+
+  if args.serve is not None:
+    from mammoth_verbose_server import serve
+    if args.incremental:
+      parser.error("--incremental can't be used with --serve")
+    if args.partWorkers > 1:
+      parser.error("--part-workers can't be used with --serve")
+    del options["incremental"]
+    host, _, port = args.serve.rpartition(":")
+    serve(host or "127.0.0.1", int(port), workers=max(1, args.workers), backlog=args.backlog, timeout=args.timeout, **options)
+    return 0
+
+  fileNames = getInputFiles(args.filenames)
+  if args.stdout:
+    if len(fileNames) != 1:
+      parser.error("--stdout takes exactly one input file")
+    options["stdout"] = True
+  failed = 0
+
+  if args.workers <= 1 or len(fileNames) <= 1:
+    for fileName in fileNames:
+      try:
+        convertFile(fileName, **options)
+      except Exception as e:
+        print("%s: %s" % (fileName, e), file=sys.stderr)
+        failed += 1
+  else:
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+      futures = {}
+      for fileName in fileNames:
+        futures[executor.submit(convertFile, fileName, **options)] = fileName
+      for future in as_completed(futures):
+        try:
+          future.result()
+        except Exception as e:
+          print("%s: %s" % (futures[future], e), file=sys.stderr)
+          failed += 1
+
+  return 1 if failed else 0
@@ -0,0 +1,195 @@
+# a long-running conversion server, so that converting a document doesn't
+# pay for starting Python and importing lxml and mammoth every time.
+#
+# POST the bytes of a docx to any path, and the response is JSON with the
+# HTML and mammoth's messages: {"html": ..., "messages": [{"type": ...,
+# "message": ...}]}. the query string can override the verbose and map
+# options the server was started with, as ?verbose=1 or ?map=0. compact
+# verbose output (?compact=1) also has the "styles" of its classes.
+#
+# conversions run in a pool of worker processes that are started, and
+# warmed up with a small conversion, before the server starts listening.
+# at most backlog requests wait for a worker at a time; any more get a
+# 503 straight away. a conversion that isn't done within timeout seconds
+# of the request arriving gets a 504, and its worker is killed and
+# replaced.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import io
+import json
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+import zipfile
+
+import mammoth_verbose
+
+# the smallest docx worth converting, for warming up the workers
+def getWarmupDocx():
+  docx = io.BytesIO()
+  package = zipfile.ZipFile(docx, 'w')
+  package.writestr("[Content_Types].xml", '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                   '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                   '<Default Extension="xml" ContentType="application/xml"/>'
+                   '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                   '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/></Types>')
+  package.writestr("_rels/.rels", '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/></Relationships>')
+  package.writestr("word/_rels/document.xml.rels", '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/></Relationships>')
+  package.writestr("word/styles.xml", '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                   '<w:style w:type="paragraph" w:styleId="Normal"><w:name w:val="Normal"/></w:style></w:styles>')
+  package.writestr("word/document.xml", '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" xmlns:w14="http://schemas.microsoft.com/office/word/2010/wordml">'
+                   '<w:body><w:p w14:paraId="00000001"><w:pPr><w:pStyle w:val="Normal"/><w:jc w:val="center"/></w:pPr>'
+                   '<w:r><w:rPr><w:b/></w:rPr><w:t>warm</w:t></w:r></w:p></w:body></w:document>')
+  package.close()
+  return docx.getvalue()
+
+# the loop run by each worker process: receive (docx bytes, options),
+# convert, and send back ("ok", html, messages, styles, profile) or
+# ("error", message)
+def runWorker(conn, options):
+  # with profile=True, the profile goes back with each response
+  options = dict(options)
+  profile = options.pop("profile", False)
+  # a daemonic worker can't start processes of its own, and the pool
+  # already converts requests side by side
+  options["part_workers"] = 1
+  mammoth_verbose.convert(getWarmupDocx(), **options)
+  conn.send(("ready",))
+  while True:
+    try:
+      data, overrides = conn.recv()
+    except EOFError:
+      return
+    try:
+      requestOptions = dict(options, **overrides)
+      reports = []
+      if profile:
+        requestOptions["profile"] = reports.append
+      result = mammoth_verbose.convert(data, **requestOptions)
+      messages = [{"type": message.type, "message": message.message} for message in result.messages]
+      conn.send(("ok", result.value.decode("ascii"), messages, getattr(result, "styles", None), reports[0] if reports else None))
+    except Exception as e:
+      conn.send(("error", "%s: %s" % (type(e).__name__, e)))
+
+# start a worker process and wait for it to warm up
+def startWorker(options):
+  conn, child = multiprocessing.Pipe()
+  process = multiprocessing.Process(target=runWorker, args=(child, options), daemon=True)
+  process.start()
+  child.close()
+  conn.recv()
+  return {"process": process, "conn": conn}
+
+def stopWorker(worker):
+  worker["process"].terminate()
+  worker["process"].join()
+  worker["conn"].close()
+
+# the pool: idle workers wait in a queue, and slots bounds the number of
+# requests being converted or waiting for a worker
+def startPool(workers, backlog, options):
+  pool = {"idle": queue.Queue(), "slots": threading.BoundedSemaphore(workers + backlog), "options": options}
+  for i in range(workers):
+    pool["idle"].put(startWorker(options))
+  return pool
+
+# convert data in the pool; returns an (HTTP status, response) pair
+def convertInPool(pool, data, overrides, timeout):
+  deadline = time.monotonic() + timeout
+  if not pool["slots"].acquire(blocking=False):
+    return 503, {"error": "too many requests waiting"}
+  try:
+    try:
+      worker = pool["idle"].get(timeout=max(0, deadline - time.monotonic()))
+    except queue.Empty:
+      return 504, {"error": "timed out waiting for a worker"}
+    if time.monotonic() >= deadline:
+      # too late to convert anything: the worker goes back untouched,
+      # rather than being killed for a request that can't be answered
+      pool["idle"].put(worker)
+      return 504, {"error": "timed out waiting for a worker"}
+    try:
+      worker["conn"].send((data, overrides))
+      if not worker["conn"].poll(max(0, deadline - time.monotonic())):
+        # the conversion is still running: kill it and start over
+        stopWorker(worker)
+        worker = startWorker(pool["options"])
+        return 504, {"error": "timed out after %s seconds" % timeout}
+      reply = worker["conn"].recv()
+    except (EOFError, OSError):
+      # the worker died
+      stopWorker(worker)
+      worker = startWorker(pool["options"])
+      return 500, {"error": "the worker stopped unexpectedly"}
+    finally:
+      pool["idle"].put(worker)
+  finally:
+    pool["slots"].release()
+
+  if reply[0] == "error":
+    return 400, {"error": reply[1]}
+  response = {"html": reply[1], "messages": reply[2]}
+  if reply[3] is not None:
+    response["styles"] = reply[3]
+  if reply[4] is not None:
+    response["profile"] = reply[4]
+  return 200, response
+
+# the option overrides a request can make in its query string
+def getOverrides(path):
+  overrides = {}
+  query = parse_qs(urlparse(path).query)
+  for name, option in (("verbose", "verbose"), ("map", "map_styles"), ("compact", "compact")):
+    if name in query:
+      overrides[option] = query[name][-1] not in ("0", "false", "no")
+  return overrides
+
+def getHandler(pool, timeout):
+  class ConversionHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+      length = int(self.headers.get("Content-Length") or 0)
+      if length <= 0:
+        self.sendJSON(400, {"error": "the request body should be a docx"})
+        return
+      data = self.rfile.read(length)
+      status, response = convertInPool(pool, data, getOverrides(self.path), timeout)
+      self.sendJSON(status, response)
+
+    def sendJSON(self, status, response):
+      body = json.dumps(response).encode("utf-8")
+      self.send_response(status)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+  return ConversionHandler
+
+# run the server until interrupted. options are passed on to convert
+# for every request.
+def serve(host="127.0.0.1", port=8000, workers=2, backlog=16, timeout=30, **options):
+  pool = startPool(workers, backlog, options)
+  server = ThreadingHTTPServer((host, port), getHandler(pool, timeout), bind_and_activate=False)
+  server.daemon_threads = True
+  # connections waiting to be accepted count towards the backlog too
+  server.request_queue_size = backlog
+  server.server_bind()
+  server.server_activate()
+  print("serving on http://%s:%d/ with %d workers" % (server.server_address[0], server.server_address[1], workers), file=sys.stderr)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    while not pool["idle"].empty():
+      stopWorker(pool["idle"].get())
@@ -0,0 +1,145 @@
+# the conversion has several ways of getting to the same output (streaming,
+# on disk, in part workers, incrementally) and copies zip members without
+# decompressing them; these tests pin each of them to the plain conversion,
+# on synthetic documents from benchmarks/make_docx.py.
+import io
+import os
+import struct
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree
+
+from make_docx import makeDocx
+import mammoth_verbose
+
+def makeDocument(tmp_path, name="doc.docx", **options):
+  options = dict({"paragraphs": 150, "styles": 8, "formatted": 0.5, "runs": 3}, **options)
+  return makeDocx(str(tmp_path / name), **options)
+
+# a copy of the package at path with one part replaced
+def replacePart(path, newPath, name, data):
+  source = zipfile.ZipFile(path)
+  target = zipfile.ZipFile(newPath, "w", zipfile.ZIP_DEFLATED)
+  for info in source.infolist():
+    target.writestr(info, data if info.filename == name else source.read(info.filename))
+  target.close()
+  source.close()
+  return newPath
+
+# check that every member's local header agrees with the central directory,
+# as readers that go through the local headers (streaming unzippers) need
+def checkLocalHeaders(data):
+  package = zipfile.ZipFile(io.BytesIO(data))
+  for info in package.infolist():
+    signature, flags, method, crc, compressSize, fileSize = struct.unpack("<4s2xHH4xIII", data[info.header_offset:info.header_offset + 26])
+    assert signature == b"PK\x03\x04"
+    assert not flags & 0x08
+    assert (method, crc, compressSize, fileSize) == (info.compress_type, info.CRC, info.compress_size, info.file_size)
+
+# a file that can only be written to, so that zipfile has to write a data
+# descriptor after each member, as some zip tools do
+class WriteOnly(object):
+  def __init__(self):
+    self.buffer = io.BytesIO()
+
+  def write(self, data):
+    return self.buffer.write(data)
+
+  def flush(self):
+    pass
+
+def test_streamed_document_matches_tree(tmp_path):
+  path = makeDocument(tmp_path, images=2, imageSize=4096)
+  source = zipfile.ZipFile(path)
+  stylesSource = source.read("word/styles.xml")
+
+  registry = mammoth_verbose.getStyleRegistry(etree.fromstring(stylesSource))
+  root = mammoth_verbose.rewritePart(source.read("word/document.xml"), registry)
+  tree = etree.tostring(root, encoding="UTF-8", standalone=True, xml_declaration=True)
+
+  streamRegistry = mammoth_verbose.getStyleRegistry(etree.fromstring(stylesSource))
+  streamed = io.BytesIO()
+  mammoth_verbose.streamDirectFormatting(source, streamRegistry, streamed)
+  source.close()
+
+  assert streamed.getvalue() == tree
+  assert etree.tostring(streamRegistry["root"]) == etree.tostring(registry["root"])
+
+def test_stream_and_on_disk_match(tmp_path):
+  path = makeDocument(tmp_path, images=2, imageSize=4096, notes=20)
+  for verbose in (False, True):
+    expected = mammoth_verbose.convert(path, verbose=verbose).value
+    assert mammoth_verbose.convert(path, verbose=verbose, stream=True).value == expected
+    assert mammoth_verbose.convert(path, verbose=verbose, on_disk=True).value == expected
+
+def test_part_workers_match_sequential(tmp_path):
+  path = makeDocument(tmp_path, notes=40)
+  expected = mammoth_verbose.convert(path, verbose=True).value
+  assert b"footnote-" in expected
+  for workers in (2, 4):
+    assert mammoth_verbose.convert(path, verbose=True, part_workers=workers).value == expected
+  assert mammoth_verbose.convert(path, verbose=True, part_workers=2, stream=True).value == expected
+
+# (without the style map, the paragraphs carry no data-source-id to split
+# the HTML at, and every conversion is a full one)
+def test_incremental_matches_full(tmp_path):
+  path = makeDocument(tmp_path)
+  state = str(tmp_path / "state.json")
+  full = mammoth_verbose.convert(path, verbose=True)
+  for run in range(2):
+    reports = []
+    result = mammoth_verbose.convert(path, verbose=True, incremental=state, profile=reports.append)
+    # the second time round, nothing has changed
+    assert reports[0]["counters"]["segments_changed"] == (reports[0]["counters"]["segments"] if run == 0 else 0)
+    assert result.value == full.value
+    assert set(result.messages) == set(full.messages)
+
+  # change the text of one paragraph, and the direct formatting of another
+  document = zipfile.ZipFile(path).read("word/document.xml")
+  document = document.replace(b"</w:t>", b" changed</w:t>", 1)
+  document = document.replace(b'<w:jc w:val="center"/>', b'<w:jc w:val="right"/>', 1)
+  edited = replacePart(path, str(tmp_path / "edited.docx"), "word/document.xml", document)
+  reports = []
+  result = mammoth_verbose.convert(edited, verbose=True, incremental=state, profile=reports.append)
+  # only the edited paragraphs went through mammoth again
+  assert 0 < reports[0]["counters"]["segments_changed"] < reports[0]["counters"]["segments"]
+  full = mammoth_verbose.convert(edited, verbose=True)
+  assert result.value == full.value
+  assert set(full.messages) <= set(result.messages)
+
+def test_copied_members_stay_valid(tmp_path):
+  path = makeDocument(tmp_path, images=3, imageSize=4096)
+  source = zipfile.ZipFile(path)
+  data = mammoth_verbose.buildDocx(path, {"word/document.xml": b"<changed/>"}).getvalue()
+  checkLocalHeaders(data)
+  rebuilt = zipfile.ZipFile(io.BytesIO(data))
+  assert rebuilt.testzip() is None
+  assert rebuilt.read("word/document.xml") == b"<changed/>"
+  for info in source.infolist():
+    if info.filename != "word/document.xml":
+      assert rebuilt.read(info.filename) == source.read(info.filename)
+      assert rebuilt.getinfo(info.filename).compress_type == info.compress_type
+
+def test_data_descriptor_source(tmp_path):
+  path = makeDocument(tmp_path, images=2, imageSize=4096, notes=10)
+  source = zipfile.ZipFile(path)
+  output = WriteOnly()
+  target = zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED)
+  for info in source.infolist():
+    with target.open(info.filename, "w") as member:
+      member.write(source.read(info.filename))
+  target.close()
+  data = output.buffer.getvalue()
+  assert all(info.flag_bits & 0x08 for info in zipfile.ZipFile(io.BytesIO(data)).infolist())
+
+  data = mammoth_verbose.buildDocx(io.BytesIO(data), {}).getvalue()
+  checkLocalHeaders(data)
+  rebuilt = zipfile.ZipFile(io.BytesIO(data))
+  assert rebuilt.testzip() is None
+  for info in source.infolist():
+    assert rebuilt.read(info.filename) == source.read(info.filename)
+  assert mammoth_verbose.convert(data, verbose=True).value == mammoth_verbose.convert(path, verbose=True).value